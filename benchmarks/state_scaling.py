@@ -0,0 +1,141 @@
+"""Throughput of chat turns through the shared state path, by replica count.
+
+Each replica is a separate process standing in for one Streamlit server. A turn
+runs the same state code as the chat page: `load_session_state` for a random
+user, `extract_document_cached` for the user's attachment on their first turn,
+`store_session_value` after the user message, `build_messages`, an optional
+simulated LLM wait (`--llm-ms`), and `store_session_value` after the assistant
+message. A user whose conversation reaches `--max-messages` starts over, so
+conversation size stays comparable across runs. Throughput should grow with the
+number of replicas until the backend or the cores saturate.
+
+Usage:
+    python benchmarks/state_scaling.py --backend sqlite:///bench_state.db --replicas 1,2,4
+    python benchmarks/state_scaling.py --backend redis://localhost:6379/0
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcpGPT import (
+    build_messages,
+    extract_document_cached,
+    load_session_state,
+    store_session_value,
+)
+from stateBackend import get_state_backend
+
+
+def make_attachment(user: int) -> io.BytesIO:
+    """A small text upload, different for every user"""
+    file = io.BytesIO((f"Notes of user {user}.\n" + "Quarterly figures and remarks. " * 200).encode('utf-8'))
+    file.name = "notes.txt"
+    return file
+
+
+def run_turn(backend, session_id: str, user: int, turn: int, llm_ms: float, max_messages: int):
+    state = load_session_state(backend, session_id)
+    conversation = state['conversation']
+    uploaded_files = state['uploaded_files']
+    config = state['config']
+
+    if not uploaded_files:
+        content, _ = extract_document_cached(
+            make_attachment(user), config['extraction_max_chars'], config['extraction_max_elements'], backend
+        )
+        uploaded_files = {"notes.txt": content}
+        store_session_value(backend, session_id, 'uploaded_files', uploaded_files)
+    if len(conversation) >= max_messages:
+        conversation = []
+
+    conversation.append({"role": "user", "content": f"question {turn}", "timestamp": "00:00:00"})
+    store_session_value(backend, session_id, 'conversation', conversation)
+
+    build_messages(uploaded_files, conversation)
+    if llm_ms:
+        time.sleep(llm_ms / 1000)
+
+    conversation.append({"role": "assistant", "content": "answer " * 50, "timestamp": "00:00:00"})
+    store_session_value(backend, session_id, 'conversation', conversation)
+
+
+def run_replica(url: str, sessions: int, duration: float, llm_ms: float, max_messages: int,
+                start_at: float, results):
+    backend = get_state_backend(url)
+    rng = random.Random(os.getpid())
+    turns = 0
+    latencies = []
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+
+    while time.time() < deadline:
+        turn_start = time.perf_counter()
+        user = rng.randrange(sessions)
+        run_turn(backend, f"bench-{user}", user, turns, llm_ms, max_messages)
+        latencies.append(time.perf_counter() - turn_start)
+        turns += 1
+
+    results.put((turns, latencies))
+
+
+def measure(url: str, replicas: int, sessions: int, duration: float, llm_ms: float,
+            max_messages: int) -> dict:
+    results = multiprocessing.Queue()
+    start_at = time.time() + 1.0  # let every replica start before the clock runs
+    processes = [
+        multiprocessing.Process(
+            target=run_replica, args=(url, sessions, duration, llm_ms, max_messages, start_at, results)
+        )
+        for _ in range(replicas)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    turns = sum(count for count, _ in collected)
+    latencies = sorted(latency for _, values in collected for latency in values)
+    return {
+        "replicas": replicas,
+        "turns": turns,
+        "throughput": turns / duration,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shared state throughput by replica count")
+    parser.add_argument('--backend', default="sqlite:///bench_state.db", help="State backend URL")
+    parser.add_argument('--replicas', default="1,2,4", help="Comma-separated replica counts")
+    parser.add_argument('--sessions', type=int, default=200, help="Distinct simulated users")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per measurement")
+    parser.add_argument('--llm-ms', type=float, default=0.0, help="Simulated LLM latency per turn")
+    parser.add_argument('--max-messages', type=int, default=40,
+                        help="Conversation length at which a simulated user starts over")
+    args = parser.parse_args()
+
+    if args.backend.startswith("memory://"):
+        parser.error("memory:// is per-process; replicas would not share state")
+
+    print(f"Backend {args.backend}, {args.llm_ms}ms simulated LLM per turn, {os.cpu_count()} cores")
+    print(f"{'replicas':>8} {'turns/s':>10} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    baseline = None
+    for replicas in [int(n) for n in args.replicas.split(',')]:
+        result = measure(args.backend, replicas, args.sessions, args.duration, args.llm_ms, args.max_messages)
+        baseline = baseline or result["throughput"]
+        print(f"{result['replicas']:>8} {result['throughput']:>10.1f} {result['throughput'] / baseline:>7.2f}x "
+              f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Headless batch mode for mcpGPT.
+
+Runs a JSONL file of conversations through the same pipeline as the Streamlit
+chat page (file context, `chat_with_llm`, `execute_tool`) without session state.
+
+Each input line is a JSON object:
+    {"id": "case-1", "conversation": [{"role": "user", "content": "..."}],
+     "attachments": ["docs/report.pdf"]}
+A plain {"id": ..., "prompt": "..."} is accepted as a one-message conversation.
+Relative attachment paths are resolved against the input file's directory.
+
+Results are appended to the output JSONL as soon as each record finishes, so the
+output file doubles as the checkpoint: rerunning the same command skips every id
+already written with "success": true.
+
+Usage:
+    python mcpBatch.py prompts.jsonl results.jsonl --workers 8 --max-requests-per-minute 120
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from mcpGPT import (
+    DEFAULT_CONFIG,
+    build_messages,
+    discover_tools,
+    ensure_string_content,
+    extract_document_cached,
+    init_openai,
+    run_chat_turn,
+)
+from stateBackend import get_state_backend
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing LLM requests evenly to respect a per-minute budget"""
+
+    def __init__(self, max_requests_per_minute: float = 0):
+        self.interval = 60.0 / max_requests_per_minute if max_requests_per_minute else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_records(input_path: str) -> List[Dict]:
+    """Read input records, assigning line-number ids where missing"""
+    records = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record.setdefault('id', f"line-{line_no}")
+            records.append(record)
+    return records
+
+
+def load_checkpoint(output_path: str) -> set:
+    """Return ids already completed successfully in a previous run"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Partial line left by a crash mid-write
+                continue
+            if result.get('success'):
+                done.add(str(result.get('id')))
+    return done
+
+
+class AttachmentCache:
+    """Extract each attachment once, even when several records share it"""
+
+    def __init__(self, max_chars: int = None, max_elements: int = None, shared_cache=None):
+        self.max_chars = max_chars
+        self.max_elements = max_elements
+        self.shared_cache = shared_cache
+        self.contents = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> str:
+        with self.lock:
+            if path in self.contents:
+                return self.contents[path]
+        with open(path, 'rb') as file:
+            content, _ = extract_document_cached(file, self.max_chars, self.max_elements, self.shared_cache)
+        with self.lock:
+            self.contents[path] = content
+        return content
+
+
+def process_record(record: Dict, config: Dict, tools: Dict, limiter: RateLimiter,
+                   attachments: AttachmentCache, base_dir: str = '', host=None) -> Dict:
+    """Run one conversation through the chat pipeline and return its result line"""
+    start_time = time.time()
+    try:
+        conversation = record.get('conversation')
+        if conversation is None:
+            conversation = [{"role": "user", "content": ensure_string_content(record.get('prompt'))}]
+
+        # Keyed by the path as given, so same-named files in different folders both reach the context
+        uploaded_files = {
+            path: attachments.get(os.path.join(base_dir, path))
+            for path in record.get('attachments', [])
+        }
+        messages = build_messages(uploaded_files, conversation)
+
+        assistant_msg = run_chat_turn(messages, config, tools, raise_errors=True, host=host,
+                                      rate_limiter=limiter)
+
+        return {
+            "id": record['id'],
+            "success": True,
+            "content": assistant_msg['content'],
+            "tools_used": assistant_msg.get('tools_used', []),
+            "latency": round(time.time() - start_time, 3)
+        }
+    except Exception as e:
+        return {
+            "id": record['id'],
+            "success": False,
+            "error": str(e),
+            "latency": round(time.time() - start_time, 3)
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_batch(input_path: str, output_path: str, config: Dict, workers: int = 4,
+              max_requests_per_minute: float = 0, tools_dir: str = 'tools', host=None) -> Dict:
+    """Process every pending record concurrently and return the run summary"""
+    init_openai(config)
+    if host is None:
+        tools = discover_tools(tools_dir, on_error=lambda msg: print(msg, file=sys.stderr))
+    else:
+        tools = host.describe()
+
+    records = load_records(input_path)
+    done = load_checkpoint(output_path)
+    pending = [r for r in records if str(r['id']) not in done]
+
+    limiter = RateLimiter(max_requests_per_minute)
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    # Share extractions with the UI replicas when MCP_STATE_URL points at a shared backend
+    shared_cache = get_state_backend() if os.environ.get("MCP_STATE_URL") else None
+    attachments = AttachmentCache(config.get('extraction_max_chars'), config.get('extraction_max_elements'),
+                                  shared_cache)
+    write_lock = threading.Lock()
+    latencies = []
+    failures = 0
+
+    # Make sure a half-written line from a crash does not swallow the next result
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    else:
+        needs_newline = False
+
+    start_time = time.time()
+    with open(output_path, 'a', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        if needs_newline:
+            out.write('\n')
+        futures = [
+            pool.submit(process_record, record, config, tools, limiter, attachments, base_dir, host)
+            for record in pending
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                out.flush()
+                os.fsync(out.fileno())
+            latencies.append(result['latency'])
+            if not result['success']:
+                failures += 1
+                print(f"[{result['id']}] failed: {result['error']}", file=sys.stderr)
+    elapsed = time.time() - start_time
+
+    return {
+        "total": len(records),
+        "skipped": len(records) - len(pending),
+        "processed": len(pending),
+        "failed": failures,
+        "elapsed": round(elapsed, 2),
+        "throughput": round(len(pending) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_max": max(latencies) if latencies else 0.0
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Run JSONL conversations through mcpGPT headlessly")
+    parser.add_argument('input', help="Input JSONL of conversations")
+    parser.add_argument('output', help="Output JSONL (also used as the resume checkpoint)")
+    parser.add_argument('--config', help="JSON file overriding DEFAULT_CONFIG (api_key, model, ...)")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent conversations")
+    parser.add_argument('--max-requests-per-minute', type=float, default=0,
+                        help="Max LLM API requests per minute across all workers (0 = unlimited)")
+    parser.add_argument('--tools-dir', default='tools', help="Directory containing tool-*.py files")
+    parser.add_argument('--tool-workers', type=int, default=0,
+                        help="Run tools in this many out-of-process workers (0 = in-process)")
+    args = parser.parse_args(argv)
+
+    config = DEFAULT_CONFIG.copy()
+    if args.config:
+        with open(args.config, 'r') as f:
+            config.update(json.load(f))
+
+    host = None
+    if args.tool_workers:
+        from toolHost import ToolHost
+        # Workers receive the OpenAI settings with each call
+        host = ToolHost(workers=args.tool_workers, tools_dir=args.tools_dir)
+    try:
+        summary = run_batch(args.input, args.output, config, args.workers,
+                            args.max_requests_per_minute, args.tools_dir, host)
+    finally:
+        if host is not None:
+            host.shutdown()
+
+    print(f"Records: {summary['total']} total, {summary['skipped']} resumed from checkpoint, "
+          f"{summary['processed']} processed, {summary['failed']} failed")
+    print(f"Elapsed: {summary['elapsed']}s, throughput: {summary['throughput']} conversations/s")
+    print(f"Latency: p50 {summary['latency_p50']}s, p95 {summary['latency_p95']}s, "
+          f"max {summary['latency_max']}s")
+    if host is not None:
+        for name, entry in host.stats().items():
+            print(f"Tool {name}: {entry['calls']} calls, {entry['failures']} failed, "
+                  f"avg {entry['avg_latency']}s, max {entry['max_latency']}s")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,7 @@ import time
 import os
 import json
 import openai
-from typing import Dict, List, Any, Union
+from typing import Dict, List, Any, Optional, Union
 import base64
 from io import StringIO
 import importlib.util
@@ -14,9 +14,18 @@ import sys
 import pandas as pd
 from PyPDF2 import PdfReader
 from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 import pptx
+from pptx.shapes.group import GroupShape
 import textwrap
 import inspect
+import csv
+import uuid
+import hashlib
+import hmac
+import secrets
+from concurrent.futures import ThreadPoolExecutor
 
 # Default configuration
 DEFAULT_CONFIG = {
@@ -24,18 +33,119 @@ DEFAULT_CONFIG = {
     "api_base": "https://your-endpoint.openai.azure.com/",
     "api_key": "your-api-key-here",
     "api_version": "2023-03-15-preview",
-    "model": "gpt-4o-mini"
+    "model": "gpt-4o-mini",
+    "extraction_max_chars": 100000,  # per attached document
+    "extraction_max_elements": 2000,  # paragraphs, tables, shapes, notes...
+    "tool_output_max_tokens": 2000,  # per tool message, unless the tool sets max_output_tokens
+    "tool_output_total_tokens": 6000  # all tool messages of one turn
 }
 
+# Per-user data and cached extractions expire after this long without a write
+SESSION_TTL_SECONDS = float(os.environ.get("MCP_SESSION_TTL_HOURS", "24")) * 3600
+
+# Tool host pool size for this server process (0 = run tools inside the Streamlit process)
+TOOL_HOST_WORKERS = int(os.environ.get("MCP_TOOL_HOST_WORKERS", "0"))
+
 # Application state
-if 'config' not in st.session_state:
-    st.session_state.config = DEFAULT_CONFIG.copy()
-if 'conversation' not in st.session_state:
-    st.session_state.conversation = []
-if 'uploaded_files' not in st.session_state:
-    st.session_state.uploaded_files = {}
-if 'available_tools' not in st.session_state:
-    st.session_state.available_tools = {}
+@st.cache_resource
+def get_shared_state():
+    """Shared state backend selected by MCP_STATE_URL, one per server process"""
+    from stateBackend import get_state_backend
+    return get_state_backend()
+
+def session_key(session_id: str, name: str) -> str:
+    """Backend key of a per-user value"""
+    return f"session:{session_id}:{name}"
+
+def load_session_state(backend, session_id: str) -> Dict:
+    """Read a user's config (over the read-only defaults), conversation and uploaded files"""
+    return {
+        'config': {**DEFAULT_CONFIG, **backend.get(session_key(session_id, 'config'), {})},
+        'conversation': backend.get(session_key(session_id, 'conversation'), []),
+        'uploaded_files': backend.get(session_key(session_id, 'uploaded_files'), {})
+    }
+
+def store_session_value(backend, session_id: str, name: str, value: Any):
+    """Write a per-user value, refreshing its expiry"""
+    backend.set(session_key(session_id, name), value, ttl=SESSION_TTL_SECONDS)
+
+def store_session_config(backend, session_id: str, config: Dict):
+    """Write a user's config, except the API key which never leaves the process"""
+    store_session_value(backend, session_id, 'config',
+                        {key: value for key, value in config.items() if key != 'api_key'})
+
+def resolve_api_key(config: Dict, own_key: str = None) -> str:
+    """The key entered in this session, else OPENAI_API_KEY if the session uses the default endpoint
+
+    The server's key is never sent to an endpoint chosen by a user.
+    """
+    if own_key:
+        return own_key
+    if config['api_base'] == DEFAULT_CONFIG['api_base']:
+        return os.environ.get("OPENAI_API_KEY", DEFAULT_CONFIG['api_key'])
+    return DEFAULT_CONFIG['api_key']
+
+def get_session_secret(backend) -> bytes:
+    """Key signing session IDs: MCP_SESSION_SECRET, else one generated once in the shared backend"""
+    secret = os.environ.get("MCP_SESSION_SECRET")
+    if not secret:
+        secret = backend.get('session_secret')
+        if secret is None:
+            backend.set('session_secret', secrets.token_hex(32))
+            secret = backend.get('session_secret')
+    return secret.encode('utf-8')
+
+def sign_session_id(session_id: str, secret: bytes) -> str:
+    """URL token for a session ID: the ID and its HMAC"""
+    signature = hmac.new(secret, session_id.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f"{session_id}.{signature}"
+
+def verify_session_token(token: Optional[str], secret: bytes) -> Optional[str]:
+    """Return the session ID of a token issued by sign_session_id, or None"""
+    session_id = (token or "").partition('.')[0]
+    if len(session_id) != 32 or any(c not in '0123456789abcdef' for c in session_id):
+        return None
+    if not hmac.compare_digest(sign_session_id(session_id, secret), token):
+        return None
+    return session_id
+
+def session_exists(backend, session_id: str) -> bool:
+    """Whether the backend still holds data for a session"""
+    return any(
+        backend.get(session_key(session_id, name)) is not None
+        for name in ('conversation', 'uploaded_files', 'config')
+    )
+
+def save_session_value(name: str):
+    """Write a session_state entry back to the shared backend"""
+    store_session_value(get_shared_state(), st.session_state.session_id, name, st.session_state[name])
+
+def init_session_state():
+    """Initialize Streamlit session state (kept out of import time for headless use)"""
+    backend = get_shared_state()
+    
+    # The signed session ID lives in the URL so any replica can resume the same user.
+    # It is a bearer token: whoever has the URL has the conversation. Only IDs issued
+    # here that still hold data are resumed; anything else gets a fresh ID, so a
+    # forged or planted link cannot pin a user to a chosen session.
+    if 'session_id' not in st.session_state:
+        secret = get_session_secret(backend)
+        session_id = verify_session_token(st.query_params.get('sid'), secret)
+        if session_id is None or not session_exists(backend, session_id):
+            session_id = uuid.uuid4().hex
+            st.query_params['sid'] = sign_session_id(session_id, secret)
+        st.session_state.session_id = session_id
+    
+    # Refresh from the backend on every run: the previous request may have hit another replica
+    state = load_session_state(backend, st.session_state.session_id)
+    st.session_state.config = {
+        **state['config'],
+        'api_key': resolve_api_key(state['config'], st.session_state.get('api_key'))
+    }
+    st.session_state.conversation = state['conversation']
+    st.session_state.uploaded_files = state['uploaded_files']
+    if 'available_tools' not in st.session_state:
+        st.session_state.available_tools = {}
 
 def ensure_string_content(content: Any) -> str:
     """Ensure the content is a valid string, handling null/None and other types"""
@@ -69,12 +179,17 @@ def load_config():
     except FileNotFoundError:
         pass
 
-def init_openai():
+# Settings a tool needs to call OpenAI itself; sent with each tool host call
+OPENAI_SETTINGS = ('api_type', 'api_base', 'api_key', 'api_version')
+
+def init_openai(config: Dict = None):
     """Initialize OpenAI client"""
-    openai.api_type = st.session_state.config['api_type']
-    openai.api_base = st.session_state.config['api_base']
-    openai.api_key = st.session_state.config['api_key']
-    openai.api_version = st.session_state.config['api_version']
+    if config is None:
+        config = st.session_state.config
+    openai.api_type = config['api_type']
+    openai.api_base = config['api_base']
+    openai.api_key = config['api_key']
+    openai.api_version = config['api_version']
 
 def convert_to_string(value: Any) -> str:
     """Convert any value to string safely"""
@@ -102,45 +217,171 @@ def extract_text_from_excel(file):
     df = pd.read_excel(file)
     return df.to_markdown()
 
-def extract_text_from_word(file):
-    """Extract text from Word document"""
+class ExtractionBudget:
+    """Collect extracted elements for one document within character/element caps"""
+    
+    def __init__(self, max_chars: int, max_elements: int):
+        self.max_chars = max_chars
+        self.max_elements = max_elements
+        self.parts = []
+        self.chars = 0
+        self.chars_omitted = 0
+        self.elements_omitted = 0
+    
+    def add(self, text: str):
+        text = (text or "").strip()
+        if not text:
+            return
+        if len(self.parts) >= self.max_elements or self.chars >= self.max_chars:
+            self.elements_omitted += 1
+            self.chars_omitted += len(text)
+            return
+        room = self.max_chars - self.chars
+        if len(text) > room:
+            self.chars_omitted += len(text) - room
+            text = text[:room]
+        self.parts.append(text)
+        self.chars += len(text)
+    
+    def report(self) -> Dict:
+        return {
+            "truncated": bool(self.chars_omitted or self.elements_omitted),
+            "chars_kept": self.chars,
+            "chars_omitted": self.chars_omitted,
+            "elements_kept": len(self.parts),
+            "elements_omitted": self.elements_omitted
+        }
+    
+    def text(self) -> str:
+        text = "\n".join(self.parts)
+        if self.chars_omitted or self.elements_omitted:
+            text += (f"\n[Truncated: {self.elements_omitted} elements and "
+                     f"{self.chars_omitted} characters omitted]")
+        return text
+
+def table_to_csv(rows: List[List[str]]) -> str:
+    """Serialize table rows as compact CSV"""
+    buffer = StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow([" ".join(cell.split()) for cell in row])
+    return buffer.getvalue().strip()
+
+def extract_word(file, budget: ExtractionBudget):
+    """Extract a Word document in reading order: headings, paragraphs and tables as CSV"""
     doc = Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
+    table_count = 0
+    for child in doc.element.body.iterchildren():
+        if child.tag.endswith('}p'):
+            para = Paragraph(child, doc)
+            style = para.style.name if para.style is not None else ""
+            if style == "Title":
+                budget.add(f"# {para.text}")
+            elif style.startswith("Heading") and style[-1:].isdigit():
+                budget.add(f"{'#' * (int(style[-1]) + 1)} {para.text}")
+            elif style.startswith("List"):
+                budget.add(f"- {para.text}")
+            else:
+                budget.add(para.text)
+        elif child.tag.endswith('}tbl'):
+            table_count += 1
+            table = Table(child, doc)
+            rows = [[cell.text for cell in row.cells] for row in table.rows]
+            budget.add(f"[Table {table_count}]\n{table_to_csv(rows)}")
 
-def extract_text_from_ppt(file):
-    """Extract text from PowerPoint presentation"""
+def extract_ppt_shapes(shapes, budget: ExtractionBudget, skip_shape_id=None):
+    """Extract text frames and tables from slide shapes, descending into groups"""
+    for shape in shapes:
+        if shape.shape_id == skip_shape_id:
+            continue
+        # shape_type raises NotImplementedError on some shapes; the class is always known
+        if isinstance(shape, GroupShape):
+            extract_ppt_shapes(shape.shapes, budget)
+        elif getattr(shape, "has_table", False) and shape.has_table:
+            rows = [[cell.text for cell in row.cells] for row in shape.table.rows]
+            budget.add(f"[Table]\n{table_to_csv(rows)}")
+        elif getattr(shape, "has_text_frame", False) and shape.has_text_frame:
+            budget.add(shape.text_frame.text)
+
+def extract_ppt(file, budget: ExtractionBudget):
+    """Extract a presentation slide by slide: title, shapes, tables as CSV and speaker notes"""
     prs = pptx.Presentation(file)
-    text = []
-    for slide in prs.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                text.append(shape.text)
-    return "\n".join(text)
-
-def process_uploaded_file(file):
-    """Process uploaded file based on type"""
+    for number, slide in enumerate(prs.slides, start=1):
+        title = slide.shapes.title
+        if title is not None and title.text.strip():
+            budget.add(f"## Slide {number}: {title.text.strip()}")
+        else:
+            budget.add(f"## Slide {number}")
+        extract_ppt_shapes(slide.shapes, budget, title.shape_id if title is not None else None)
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame
+            if notes is not None and notes.text.strip():
+                budget.add(f"Notes: {notes.text}")
+
+def extract_document(file, max_chars: int = None, max_elements: int = None):
+    """Extract a file within caps and return (text, truncation report)"""
+    budget = ExtractionBudget(
+        max_chars or DEFAULT_CONFIG['extraction_max_chars'],
+        max_elements or DEFAULT_CONFIG['extraction_max_elements']
+    )
     file_ext = file.name.split('.')[-1].lower()
     
     if file_ext == 'pdf':
-        return extract_text_from_pdf(file)
+        budget.add(extract_text_from_pdf(file))
     elif file_ext in ['xlsx', 'xls']:
-        return extract_text_from_excel(file)
+        budget.add(extract_text_from_excel(file))
     elif file_ext == 'docx':
-        return extract_text_from_word(file)
+        extract_word(file, budget)
     elif file_ext == 'pptx':
-        return extract_text_from_ppt(file)
-    elif file_ext == 'txt':
-        return file.read().decode('utf-8')
+        extract_ppt(file, budget)
+    elif file_ext in ['txt', 'csv']:
+        budget.add(file.read().decode('utf-8'))
     else:
-        return f"File content {file.name} not extracted (unsupported format)"
+        budget.add(f"File content {file.name} not extracted (unsupported format)")
+    
+    return budget.text(), budget.report()
+
+def extract_document_cached(file, max_chars: int = None, max_elements: int = None, cache=None):
+    """extract_document keyed by file content hash and caps in a shared state backend"""
+    if cache is None:
+        return extract_document(file, max_chars, max_elements)
+    
+    digest = hashlib.sha256(file.read()).hexdigest()
+    file.seek(0)
+    key = f"extract:{digest}:{max_chars}:{max_elements}"
+    cached = cache.get(key)
+    if cached is not None:
+        return tuple(cached)
+    
+    result = extract_document(file, max_chars, max_elements)
+    cache.set(key, list(result), ttl=SESSION_TTL_SECONDS)
+    return result
+
+def process_uploaded_files(files: List, max_chars: int = None, max_elements: int = None,
+                           max_workers: int = 4, cache=None) -> Dict:
+    """Extract several files in parallel and return {name: (text, truncation report)}
+
+    A file that fails to extract gets (None, {"error": message}) without affecting the others.
+    """
+    if not files:
+        return {}
+    
+    def extract(file):
+        try:
+            return extract_document_cached(file, max_chars, max_elements, cache)
+        except Exception as e:
+            return None, {"error": str(e), "truncated": False}
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as pool:
+        results = pool.map(extract, files)
+        return {file.name: result for file, result in zip(files, results)}
 
 # Tool management functions
-def load_tools():
-    """Load tools from tools/ directory"""
-    tools_dir = 'tools'
+def discover_tools(tools_dir: str = 'tools', on_error=None) -> Dict:
+    """Import every tools/tool-*.py module and return the tool registry"""
     os.makedirs(tools_dir, exist_ok=True)
     
-    st.session_state.available_tools = {}
+    tools = {}
     
     for tool_path in glob.glob(os.path.join(tools_dir, 'tool-*.py')):
         try:
@@ -149,43 +390,112 @@ def load_tools():
             mod = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(mod)
             
-            st.session_state.available_tools[tool_name] = {
+            tools[tool_name] = {
                 'function': mod.function_call,
                 'schema': getattr(mod, 'function_schema', {}),
                 'description': getattr(mod, 'description', "No description available"),
+                'max_output_tokens': getattr(mod, 'max_output_tokens', None),
+                'spill_output': getattr(mod, 'spill_output', True),
                 'code': inspect.getsource(mod)
             }
         except Exception as e:
-            st.error(f"Error loading tool {tool_path}: {str(e)}")
+            if on_error:
+                on_error(f"Error loading tool {tool_path}: {str(e)}")
+    
+    return tools
+
+@st.cache_resource
+def get_tool_host():
+    """Return the process-wide tool host (MCP_TOOL_HOST_WORKERS), or None when tools run in-process"""
+    if not TOOL_HOST_WORKERS:
+        return None
+    from toolHost import ToolHost
+    return ToolHost(workers=TOOL_HOST_WORKERS)
 
-def get_tools_schema():
+def load_tools(reload: bool = True):
+    """Load tools from tools/ directory"""
+    backend = get_shared_state()
+    if reload:
+        # Tell the other replicas that the tools changed
+        backend.set('tools:version', uuid.uuid4().hex)
+    
+    host = get_tool_host()
+    if host is None:
+        st.session_state.available_tools = discover_tools(on_error=st.error)
+        return
+    
+    # Tool modules are only imported by the host workers
+    try:
+        shared_version = backend.get('tools:version')
+        if host.version != shared_version:
+            host.reload(shared_version)
+        st.session_state.available_tools = {
+            name: {**info, 'function': None} for name, info in host.describe().items()
+        }
+    except Exception as e:
+        st.error(str(e))
+
+def get_tools_schema(tools: Dict = None):
     """Return tools schema for OpenAI"""
+    if tools is None:
+        tools = st.session_state.available_tools
     return [
         {
             "name": name,
             "description": info.get('description', f"Execute {name} function"),
             "parameters": info['schema']
-        } for name, info in st.session_state.available_tools.items()
+        } for name, info in tools.items()
     ]
 
-def execute_tool(tool_name: str, arguments: Dict) -> Dict:
-    """Execute a tool and return standardized response"""
+def execute_tool(tool_name: str, arguments: Dict, tools: Dict = None, host=None,
+                 max_tokens: int = None, config: Dict = None) -> Dict:
+    """Execute a tool and return standardized response
+
+    With max_tokens, the content is passed through the output governor where the tool
+    runs; an oversized result comes back as a preview plus an "artifact" for the caller
+    to store. config supplies the caller's OpenAI settings to host workers.
+    """
+    if host is not None:
+        openai_config = {key: config[key] for key in OPENAI_SETTINGS if key in config} if config else None
+        return host.call(tool_name, arguments, max_tokens, openai_config)
+    if tools is None:
+        tools = st.session_state.available_tools
     try:
-        if tool_name not in st.session_state.available_tools:
+        if tool_name not in tools:
             return {
                 "success": False,
                 "content": f"Tool {tool_name} not found",
                 "error": "Tool not found"
             }
         
-        tool_func = st.session_state.available_tools[tool_name]['function']
+        tool_func = tools[tool_name]['function']
         result = tool_func(**arguments)
         
-        return {
+        # Tools that need widgets return UI directives instead of calling st directly
+        ui_directives = []
+        if isinstance(result, dict) and 'ui_directives' in result:
+            ui_directives = result['ui_directives']
+            result = result.get('result')
+        
+        if max_tokens is None:
+            return {
+                "success": True,
+                "content": convert_to_string(result),
+                "raw_result": result,
+                "ui_directives": ui_directives
+            }
+        
+        content, artifact = govern_tool_result(tool_name, result, max_tokens)
+        response = {
             "success": True,
-            "content": convert_to_string(result),
-            "raw_result": result
+            "content": content,
+            "ui_directives": ui_directives
         }
+        if artifact:
+            response["artifact"] = artifact
+        else:
+            response["raw_result"] = result
+        return response
     except Exception as e:
         return {
             "success": False,
@@ -193,6 +503,180 @@ def execute_tool(tool_name: str, arguments: Dict) -> Dict:
             "error": str(e)
         }
 
+# Tool output governor
+# Results smaller than the spill notice itself are always sent as-is
+NOTICE_TOKENS = 80
+ARTIFACT_PAGE_CHARS = 6000
+
+# Built-in tool paging through spilled results. It runs in the app process, which
+# owns the session's artifacts, and is bounded by the turn budget instead of spilling.
+READ_ARTIFACT_TOOL = 'read_artifact'
+READ_ARTIFACT_INFO = {
+    'function': None,
+    'schema': {
+        "type": "object",
+        "properties": {
+            "artifact_id": {
+                "type": "string",
+                "description": "Artifact ID given in a truncated tool result"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Character offset to start reading from",
+                "default": 0
+            },
+            "length": {
+                "type": "integer",
+                "description": f"Number of characters to read (max {ARTIFACT_PAGE_CHARS})",
+                "default": ARTIFACT_PAGE_CHARS
+            }
+        },
+        "required": ["artifact_id"]
+    },
+    'description': "Read a page of a large tool result stored as an artifact, by artifact ID and character offset.",
+    'max_output_tokens': None,
+    'spill_output': False,
+    'code': ""
+}
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+def estimate_dataframe_tokens(df: pd.DataFrame) -> int:
+    """Estimate the markdown size of a DataFrame from its first rows, without rendering it all"""
+    sample = df.head(20)
+    if len(sample) == 0:
+        return estimate_tokens(sample.to_markdown())
+    return estimate_tokens(sample.to_markdown()) * len(df) // len(sample) + 1
+
+def save_artifact(backend, session_id: str, tool_name: str, artifact: Dict):
+    """Store a spilled tool result under the session, expiring with the rest of its data"""
+    store_session_value(backend, session_id, f"artifact:{artifact['id']}", {
+        "tool": tool_name,
+        "format": artifact['format'],
+        "content": artifact['content'],
+        "created": datetime.now().isoformat(timespec='seconds')
+    })
+
+def read_artifact(backend, session_id: str, artifact_id: str, offset: int = 0,
+                  length: int = ARTIFACT_PAGE_CHARS, max_chars: int = None) -> str:
+    """Return a page of one of the session's artifacts, with the offset of the next page
+
+    max_chars bounds the whole reply (header, page and footer) to the turn's remaining budget.
+    """
+    artifact = backend.get(session_key(session_id, f"artifact:{artifact_id}"))
+    if artifact is None:
+        return f"Artifact {artifact_id} not found"
+    
+    content = artifact['content']
+    offset = max(0, int(offset))
+    length = max(1, min(int(length), ARTIFACT_PAGE_CHARS))
+    header = (f"[Artifact {artifact_id} from {artifact['tool']} ({artifact['format']}), "
+              f"characters {offset}-{{end}} of {len(content)}]")
+    if max_chars is not None:
+        # Leave room for the header and footer, whose lengths barely vary
+        length = min(length, max_chars - len(header) - 40)
+        if length <= 0:
+            return (f"[Tool output budget for this turn is used up; read artifact {artifact_id} "
+                    f"from offset={offset} in a later turn]")
+    
+    page = content[offset:offset + length]
+    end = offset + len(page)
+    footer = f"\n[Next page: offset={end}]" if end < len(content) else "\n[End of artifact]"
+    return header.format(end=end) + "\n" + page + footer
+
+def preview_tool_result(raw_result: Any, content: str, max_chars: int) -> str:
+    """Compact preview of a large result: schema/stats/head/tail for tables, ends of lists and text"""
+    if isinstance(raw_result, pd.DataFrame):
+        df = raw_result
+        parts = [
+            f"DataFrame with {len(df)} rows x {len(df.columns)} columns",
+            "Columns: " + ", ".join(f"{col} ({dtype})" for col, dtype in df.dtypes.items())
+        ]
+        if not df.select_dtypes('number').empty:
+            parts.append("Stats:\n" + df.describe().to_markdown())
+        parts.append("Head:\n" + df.head(5).to_markdown())
+        parts.append("Tail:\n" + df.tail(5).to_markdown())
+        preview = "\n".join(parts)
+    elif isinstance(raw_result, list):
+        preview = f"List with {len(raw_result)} items\nFirst items: " + \
+            convert_to_string(raw_result[:3])
+        if len(raw_result) > 3:
+            preview += "\nLast items: " + convert_to_string(raw_result[-3:])
+    elif isinstance(raw_result, dict):
+        preview = f"Object with {len(raw_result)} keys: " + ", ".join(map(str, raw_result))
+    else:
+        # Head and tail around the 7-character "\n[...]\n" separator, within max_chars
+        half = max(0, (max_chars - 7) // 2)
+        return f"{content[:half]}\n[...]\n{content[-half:] if half else ''}"
+    
+    if len(preview) > max_chars:
+        preview = preview[:max(0, max_chars - 6)] + "\n[...]"
+    return preview
+
+def govern_tool_result(tool_name: str, result: Any, max_tokens: int):
+    """Render a tool result within max_tokens and return (content, artifact or None)
+
+    An oversized result is replaced by a preview and returned in full as an artifact
+    {"id", "format", "content"}, which the caller stores under the session (see save_artifact).
+    Once max_tokens is used up (<= 0), only the artifact notice is returned.
+    """
+    content = None
+    if isinstance(result, pd.DataFrame):
+        # Size large tables from a sample instead of rendering them in full
+        tokens = estimate_dataframe_tokens(result)
+        if tokens <= max(max_tokens, NOTICE_TOKENS):
+            content = result.to_markdown()
+            tokens = estimate_tokens(content)
+    else:
+        content = convert_to_string(result)
+        tokens = estimate_tokens(content)
+    
+    if tokens <= max(max_tokens, NOTICE_TOKENS):
+        return content, None
+    
+    artifact_id = uuid.uuid4().hex[:12]
+    if isinstance(result, pd.DataFrame):
+        artifact = {"id": artifact_id, "format": "csv", "content": result.to_csv(index=False)}
+    else:
+        artifact = {"id": artifact_id, "format": "text", "content": content}
+    
+    notice = (f"[Result truncated: about {tokens} tokens. The full output is stored as artifact "
+              f"{artifact_id}; call read_artifact with artifact_id=\"{artifact_id}\" and an offset "
+              f"to page through it.]")
+    preview_chars = max_tokens * 4 - len(notice) - 1
+    if preview_chars <= 0:
+        return notice, artifact
+    return preview_tool_result(result, content, preview_chars) + "\n" + notice, artifact
+
+def render_ui_directives(directives: List[Dict], key_prefix: str = ""):
+    """Render widgets requested by tools (download buttons, code previews, HTML)"""
+    for i, directive in enumerate(directives):
+        kind = directive.get('type')
+        if kind == 'markdown':
+            st.markdown(directive['body'])
+        elif kind == 'code':
+            if directive.get('expander'):
+                with st.expander(directive['expander']):
+                    st.code(directive['body'], language=directive.get('language'))
+            else:
+                st.code(directive['body'], language=directive.get('language'))
+        elif kind == 'html':
+            st.components.v1.html(
+                directive['body'],
+                height=directive.get('height', 400),
+                scrolling=directive.get('scrolling', True)
+            )
+        elif kind == 'download_button':
+            st.download_button(
+                label=directive.get('label', "⬇️ Download"),
+                data=directive['data'],
+                file_name=directive['file_name'],
+                mime=directive.get('mime', "text/plain"),
+                key=f"{key_prefix}download_{i}_{directive['file_name']}"
+            )
+
 def show_tool_creation():
     """Display tool creation interface"""
     st.header("🛠 Create New Tool")
@@ -292,6 +776,14 @@ def show_tool_management():
         show_tool_creation()
     
     with tab2:
+        host = get_tool_host()
+        if host is not None:
+            st.subheader("Tool host")
+            stats = host.stats()
+            if stats:
+                st.dataframe(pd.DataFrame.from_dict(stats, orient='index'))
+            st.caption(f"{host.size} workers, {host.recycled} recycled")
+        
         if not st.session_state.available_tools:
             st.warning("No tools available")
         else:
@@ -314,8 +806,11 @@ def show_tool_management():
                         except Exception as e:
                             st.error(f"Error deleting tool: {str(e)}")
 
-def chat_with_llm(messages: List[Dict]) -> Dict:
+def chat_with_llm(messages: List[Dict], config: Dict = None, tools: Dict = None,
+                  raise_errors: bool = False) -> Dict:
     """Send messages to OpenAI API with content validation"""
+    if config is None:
+        config = st.session_state.config
     try:
         # Prepare messages with validated content
         validated_messages = []
@@ -324,19 +819,172 @@ def chat_with_llm(messages: List[Dict]) -> Dict:
             validated_msg['content'] = ensure_string_content(msg.get('content', ''))
             validated_messages.append(validated_msg)
         
-        tools = get_tools_schema()
+        tools_schema = get_tools_schema(tools)
         response = openai.ChatCompletion.create(
-            engine=st.session_state.config['model'],
+            engine=config['model'],
             messages=validated_messages,
-            tools=[{"type": "function", "function": t} for t in tools] if tools else None,
-            tool_choice="auto" if tools else None,
+            tools=[{"type": "function", "function": t} for t in tools_schema] if tools_schema else None,
+            tool_choice="auto" if tools_schema else None,
         )
         
         return response.choices[0].message
     except Exception as e:
+        if raise_errors:
+            raise
         st.error(f"OpenAI error: {str(e)}")
         return None
 
+# Chat pipeline (shared by the Streamlit UI and headless batch mode)
+# Tool-calling rounds per turn; the request after the last one offers no tools
+MAX_TOOL_ROUNDS = 5
+
+def message_content(msg: Dict) -> Any:
+    """Content of a stored message as sent to the LLM, naming the artifacts its tools left"""
+    artifacts = msg.get('artifacts')
+    if not artifacts:
+        return msg["content"]
+    return ensure_string_content(msg["content"]) + "\n[Stored tool outputs, readable with read_artifact: " + \
+        ", ".join(f"{artifact['id']} ({artifact['tool']})" for artifact in artifacts) + "]"
+
+def build_messages(uploaded_files: Dict[str, str], conversation: List[Dict]) -> List[Dict]:
+    """Build the LLM message list from attached files and conversation history"""
+    # Prepare context with uploaded files
+    context = []
+    if uploaded_files:
+        context.append({
+            "role": "system",
+            "content": "Attached files:\n" + "\n\n".join(
+                f"=== {name} ===\n{content}" 
+                for name, content in uploaded_files.items()
+            )
+        })
+    
+    # Add conversation history
+    return context + [
+        {"role": msg["role"], "content": message_content(msg)} 
+        for msg in conversation
+        if msg["role"] in ["user", "assistant", "system"]
+    ]
+
+def clamp_tool_output(content: str, max_tokens: int) -> str:
+    """Cut the output of a tool that does not spill (spill_output = False) to max_tokens"""
+    max_chars = max(0, max_tokens) * 4
+    if len(content) <= max_chars:
+        return content
+    notice = "\n[Output cut: the tool output budget of this turn is used up]"
+    return content[:max(0, max_chars - len(notice))] + notice
+
+def run_tool_call(call, config: Dict, tools: Dict, host, backend, session_id: str,
+                  remaining_tokens: int) -> Dict:
+    """Execute one tool call within the turn's remaining budget; artifacts are stored under the session"""
+    tool_name = call.function.name
+    args = json.loads(call.function.arguments)
+    
+    if tool_name == READ_ARTIFACT_TOOL:
+        try:
+            content = read_artifact(
+                backend, session_id, str(args.get('artifact_id', '')), args.get('offset', 0),
+                args.get('length', ARTIFACT_PAGE_CHARS), max_chars=max(0, remaining_tokens) * 4
+            )
+        except (TypeError, ValueError) as e:
+            content = f"Error executing tool {tool_name}: {str(e)}"
+        return {"success": True, "content": content}
+    
+    # Keep every tool message within its own cap and the turn's remaining budget;
+    # tools that bound their own output (spill_output = False) are cut instead of spilled
+    tool_info = tools.get(tool_name, {})
+    if not tool_info.get('spill_output', True):
+        tool_result = execute_tool(tool_name, args, tools, host, None, config)
+        tool_result['content'] = clamp_tool_output(tool_result['content'], remaining_tokens)
+        return tool_result
+    
+    tool_cap = tool_info.get('max_output_tokens') or \
+        config.get('tool_output_max_tokens', DEFAULT_CONFIG['tool_output_max_tokens'])
+    tool_result = execute_tool(tool_name, args, tools, host, min(tool_cap, remaining_tokens), config)
+    if tool_result.get('artifact'):
+        save_artifact(backend, session_id, tool_name, tool_result['artifact'])
+    return tool_result
+
+def run_chat_turn(messages: List[Dict], config: Dict = None, tools: Dict = None,
+                  raise_errors: bool = False, host=None, rate_limiter=None,
+                  backend=None, session_id: str = None) -> Dict:
+    """Run one assistant turn (LLM requests and tool calls until the model answers)
+
+    Returns the assistant message. The model may call tools over up to MAX_TOOL_ROUNDS
+    rounds, all sharing the turn's tool_output_total_tokens budget. Spilled results are
+    stored under session_id in backend (a store private to this turn if none is given) and
+    listed in the message's "artifacts", so later turns can still read them.
+    rate_limiter, if given, has its wait() called before every LLM request.
+    """
+    if config is None:
+        config = st.session_state.config
+    if tools is None:
+        tools = st.session_state.available_tools
+    if backend is None:
+        from stateBackend import MemoryStateBackend
+        backend, session_id = MemoryStateBackend(), "turn"
+    tools = {**tools, READ_ARTIFACT_TOOL: READ_ARTIFACT_INFO}
+    
+    tools_used = []
+    ui_directives = []
+    artifacts = []
+    remaining_tokens = config.get('tool_output_total_tokens', DEFAULT_CONFIG['tool_output_total_tokens'])
+    for round_number in range(MAX_TOOL_ROUNDS + 1):
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        round_tools = tools if round_number < MAX_TOOL_ROUNDS else {}
+        response = chat_with_llm(messages, config, round_tools, raise_errors)
+        
+        if not response:
+            if round_number == 0:
+                return None
+            return {
+                "role": "assistant",
+                "content": "Error getting final response",
+                "timestamp": datetime.now().strftime("%H:%M:%S")
+            }
+        
+        tool_calls = getattr(response, 'tool_calls', None)
+        if not tool_calls:
+            break
+        
+        # Execute tools
+        tool_responses = []
+        for call in tool_calls:
+            tool_result = run_tool_call(call, config, tools, host, backend, session_id, remaining_tokens)
+            content = tool_result['content']
+            remaining_tokens -= estimate_tokens(content)
+            ui_directives.extend(tool_result.get('ui_directives', []))
+            if tool_result.get('artifact'):
+                artifacts.append({"id": tool_result['artifact']['id'], "tool": call.function.name})
+            tools_used.append(call.function.name)
+            
+            tool_responses.append({
+                "role": "tool",
+                "content": content,
+                "name": call.function.name,
+                "tool_call_id": call.id
+            })
+        
+        # Add tool responses for the next round
+        messages = messages + [{
+            "role": response.role,
+            "content": response.content,
+            "tool_calls": tool_calls
+        }] + tool_responses
+    
+    assistant_msg = {
+        "role": "assistant",
+        "content": ensure_string_content(response.content),
+        "timestamp": datetime.now().strftime("%H:%M:%S")
+    }
+    if tools_used:
+        assistant_msg["tools_used"] = tools_used
+        assistant_msg["ui_directives"] = ui_directives
+    if artifacts:
+        assistant_msg["artifacts"] = artifacts
+    return assistant_msg
+
 # UI Pages
 def show_config_page():
     """Display API configuration page"""
@@ -360,7 +1008,8 @@ def show_config_page():
         api_key = st.text_input(
             "API Key",
             type="password",
-            value=st.session_state.config['api_key']
+            value=st.session_state.get('api_key', ""),
+            help="Leave empty to use the server's key (default endpoint only)"
         )
         
         # st.session_state.config['api_version'] = 
@@ -374,14 +1023,32 @@ def show_config_page():
             value=st.session_state.config['model']
         )
         
+        extraction_max_chars = st.number_input(
+            "Max characters extracted per attached file",
+            min_value=1000,
+            step=10000,
+            value=st.session_state.config.get('extraction_max_chars', DEFAULT_CONFIG['extraction_max_chars'])
+        )
+        
+        extraction_max_elements = st.number_input(
+            "Max elements (paragraphs, tables, shapes...) per attached file",
+            min_value=10,
+            step=100,
+            value=st.session_state.config.get('extraction_max_elements', DEFAULT_CONFIG['extraction_max_elements'])
+        )
+        
         if st.form_submit_button("Save Configuration"):
             # save_config()
             if "config" not in st.session_state:
                 st.session_state["config"] = {}
             st.session_state.config["api_type"] = api_type
             st.session_state.config["api_base"] = api_base
-            st.session_state.config["api_key"] = api_key
+            st.session_state.api_key = api_key
+            st.session_state.config["api_key"] = resolve_api_key(st.session_state.config, api_key)
             st.session_state.config["api_version"] = api_version
+            st.session_state.config["extraction_max_chars"] = int(extraction_max_chars)
+            st.session_state.config["extraction_max_elements"] = int(extraction_max_elements)
+            store_session_config(get_shared_state(), st.session_state.session_id, st.session_state.config)
 
             init_openai()
             st.success("Configuration saved!")
@@ -399,11 +1066,27 @@ def show_chat_page():
             accept_multiple_files=True
         )
         
-        for file in uploaded_files:
-            if file.name not in st.session_state.uploaded_files:
-                content = process_uploaded_file(file)
-                st.session_state.uploaded_files[file.name] = content
-                st.success(f"File {file.name} processed!")
+        new_files = [f for f in uploaded_files if f.name not in st.session_state.uploaded_files]
+        extracted = process_uploaded_files(
+            new_files,
+            st.session_state.config.get('extraction_max_chars'),
+            st.session_state.config.get('extraction_max_elements'),
+            cache=get_shared_state()
+        )
+        readable = {name: content for name, (content, _) in extracted.items() if content is not None}
+        if readable:
+            st.session_state.uploaded_files.update(readable)
+            save_session_value('uploaded_files')
+        for name, (content, report) in extracted.items():
+            if 'error' in report:
+                st.error(f"Error processing file {name}: {report['error']}")
+            elif report['truncated']:
+                st.warning(
+                    f"File {name} processed but truncated: {report['elements_omitted']} elements "
+                    f"and {report['chars_omitted']} characters omitted"
+                )
+            else:
+                st.success(f"File {name} processed!")
         
         st.header("🛠 Tools")
         if st.button("Reload Tools"):
@@ -415,9 +1098,10 @@ def show_chat_page():
             st.rerun()
     
     # Display conversation
-    for msg in st.session_state.conversation:
+    for idx, msg in enumerate(st.session_state.conversation):
         with st.chat_message(msg["role"]):
             st.write(msg["content"])
+            render_ui_directives(msg.get("ui_directives", []), key_prefix=f"msg{idx}_")
             if msg.get("timestamp"):
                 st.caption(f"At {msg['timestamp']}")
     
@@ -432,6 +1116,7 @@ def show_chat_page():
             "timestamp": now
         }
         st.session_state.conversation.append(user_msg)
+        save_session_value('conversation')
        
         with st.chat_message("user"):
             st.write(prompt)
@@ -440,83 +1125,30 @@ def show_chat_page():
         with st.spinner("Thinking..."):
             start_time = time.time()
             
-            # Prepare context with uploaded files
-            context = []
-            if st.session_state.uploaded_files:
-                context.append({
-                    "role": "system",
-                    "content": "Attached files:\n" + "\n\n".join(
-                        f"=== {name} ===\n{content}" 
-                        for name, content in st.session_state.uploaded_files.items()
-                    )
-                })
+            messages = build_messages(
+                st.session_state.uploaded_files,
+                st.session_state.conversation
+            )
             
-            # Add conversation history
-            messages = context + [
-                {"role": msg["role"], "content": msg["content"]} 
-                for msg in st.session_state.conversation
-                if msg["role"] in ["user", "assistant", "system"]
-            ]
+            assistant_msg = run_chat_turn(
+                messages,
+                host=get_tool_host(),
+                backend=get_shared_state(),
+                session_id=st.session_state.session_id
+            )
             
-            # First LLM call
-            response = chat_with_llm(messages)
-            
-            if response:
-                # Handle tool calls
-                if hasattr(response, 'tool_calls') and response.tool_calls:
-                    # Execute tools
-                    tool_responses = []
-                    for call in response.tool_calls:
-                        tool_name = call.function.name
-                        args = json.loads(call.function.arguments)
-                        
-                        tool_result = execute_tool(tool_name, args)
-                        
-                        tool_responses.append({
-                            "role": "tool",
-                            "content": tool_result['content'],
-                            "name": tool_name,
-                            "tool_call_id": call.id
-                        })
-                    
-                    # Add tool responses
-                    messages.append({
-                        "role": response.role,
-                        "content": response.content,
-                        "tool_calls": response.tool_calls
-                    })
-                    messages.extend(tool_responses)
-                    
-                    # Second call with tool results
-                    final_response = chat_with_llm(messages)
-                    
-                    if final_response:
-                        assistant_msg = {
-                            "role": "assistant",
-                            "content": final_response.content,
-                            "timestamp": datetime.now().strftime("%H:%M:%S"),
-                            "tools_used": [call.function.name for call in response.tool_calls]
-                        }
-                    else:
-                        assistant_msg = {
-                            "role": "assistant",
-                            "content": "Error getting final response",
-                            "timestamp": datetime.now().strftime("%H:%M:%S")
-                        }
-                else:
-                    # Simple response without tools
-                    assistant_msg = {
-                        "role": "assistant",
-                        "content": response.content,
-                        "timestamp": datetime.now().strftime("%H:%M:%S")
-                    }
-                
+            if assistant_msg:
                 # Add to conversation
                 st.session_state.conversation.append(assistant_msg)
+                save_session_value('conversation')
                 
                 # Display response
                 with st.chat_message("assistant"):
                     st.write(assistant_msg["content"])
+                    render_ui_directives(
+                        assistant_msg.get("ui_directives", []),
+                        key_prefix=f"msg{len(st.session_state.conversation) - 1}_"
+                    )
                     st.caption(f"Response in {time.time()-start_time:.2f}s at {assistant_msg['timestamp']}")
                     if "tools_used" in assistant_msg:
                         st.info(f"Tools used: {', '.join(assistant_msg['tools_used'])}")
@@ -524,9 +1156,10 @@ def show_chat_page():
 # Main application
 def main():
     """Main application flow"""
+    init_session_state()
     load_config()
     init_openai()
-    load_tools()
+    load_tools(reload=False)
     
     if 'current_page' not in st.session_state:
         st.session_state.current_page = "Chat"
@@ -0,0 +1,178 @@
+"""Shared state backends for mcpGPT.
+
+Conversations, uploaded-file contents, spilled tool outputs, the extraction
+cache, the tool registry version and each session's OpenAI config (without the
+API key) are kept in a key/value backend instead of only in `st.session_state`, so several Streamlit replicas
+behind a load balancer can serve the same users.
+
+Backends are selected by URL (environment variable MCP_STATE_URL):
+    memory://                  per-process dict (default, single replica only)
+    sqlite:///path/state.db    SQLite file on a volume shared by the replicas
+    redis://host:6379/0        any Redis-protocol server (needs the `redis` package)
+
+Values are stored as JSON. `set` takes an optional `ttl` in seconds; expired keys
+read as missing and are removed (Redis EX, a periodic sweep in SQLite and in memory,
+which also evicts least-recently-used keys past `max_entries`).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+
+class StateBackend(ABC):
+    """Key/value store holding JSON-serializable values"""
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raw = self._get(key)
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        self._set(key, json.dumps(value, ensure_ascii=False), ttl)
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove key if present"""
+
+    @abstractmethod
+    def _get(self, key: str):
+        """Return the raw JSON string stored under key, or None if missing or expired"""
+
+    @abstractmethod
+    def _set(self, key: str, raw: str, ttl: float = None):
+        """Store the raw JSON string under key, expiring after ttl seconds if given"""
+
+
+class MemoryStateBackend(StateBackend):
+    """In-process backend; state is shared by sessions of one process only"""
+
+    SWEEP_INTERVAL = 60  # seconds between scans for expired keys
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.next_sweep = 0.0
+        self.data = OrderedDict()  # key -> (raw, expires_at or None), least recently used first
+        self.lock = threading.Lock()
+
+    def _get(self, key: str):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            raw, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return raw
+
+    def _set(self, key: str, raw: str, ttl: float = None):
+        now = time.time()
+        with self.lock:
+            self.data[key] = (raw, now + ttl if ttl else None)
+            self.data.move_to_end(key)
+            if now >= self.next_sweep:
+                self.next_sweep = now + self.SWEEP_INTERVAL
+                expired = [k for k, (_, expires_at) in self.data.items()
+                           if expires_at is not None and expires_at <= now]
+                for k in expired:
+                    del self.data[k]
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+class SQLiteStateBackend(StateBackend):
+    """SQLite backend; one connection per thread, WAL mode for concurrent replicas"""
+
+    SWEEP_INTERVAL = 60  # seconds between deletions of expired rows
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.next_sweep = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(state)")]
+        if 'expires_at' not in columns:
+            conn.execute("ALTER TABLE state ADD COLUMN expires_at REAL")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _get(self, key: str):
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, raw: str, ttl: float = None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, raw, now + ttl if ttl else None)
+        )
+        if now >= self.next_sweep:
+            self.next_sweep = now + self.SWEEP_INTERVAL
+            conn.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        conn.commit()
+
+    def delete(self, key: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM state WHERE key = ?", (key,))
+        conn.commit()
+
+
+class RedisStateBackend(StateBackend):
+    """Redis-protocol backend; accepts any redis-py compatible client (e.g. fakeredis)"""
+
+    def __init__(self, client=None, url: str = None, prefix: str = "mcpgpt:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis state backend needs the 'redis' package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _get(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        return raw.decode('utf-8') if isinstance(raw, bytes) else raw
+
+    def _set(self, key: str, raw: str, ttl: float = None):
+        self.client.set(self.prefix + key, raw, ex=max(1, int(ttl)) if ttl else None)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+
+def get_state_backend(url: str = None) -> StateBackend:
+    """Create the backend described by url (defaults to MCP_STATE_URL, then memory://)"""
+    url = url or os.environ.get("MCP_STATE_URL", "memory://")
+    if url.startswith("memory://"):
+        return MemoryStateBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend(url=url)
+    raise ValueError(f"Unsupported state backend URL: {url}")
@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+for module in ("streamlit", "openai", "pandas", "PyPDF2", "docx", "pptx"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mcpBatch
+from mcpBatch import RateLimiter, load_checkpoint, percentile, run_batch
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 100) == 5
+    assert percentile(values, 1) == 1
+    assert percentile([], 95) == 0.0
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(max_requests_per_minute=600)  # one every 0.1s
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.29
+
+
+def test_rate_limiter_unlimited_does_not_wait():
+    limiter = RateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        limiter.wait()
+    assert time.monotonic() - start < 0.05
+
+
+def test_load_checkpoint_keeps_only_successes_and_skips_partial_lines(tmp_path):
+    output = tmp_path / "out.jsonl"
+    output.write_text(
+        json.dumps({"id": "a", "success": True}) + "\n"
+        + json.dumps({"id": "b", "success": False}) + "\n"
+        + json.dumps({"id": 3, "success": True}) + "\n"
+        + '{"id": "c", "succ'
+    )
+    assert load_checkpoint(str(output)) == {"a", "3"}
+    assert load_checkpoint(str(tmp_path / "missing.jsonl")) == set()
+
+
+@pytest.fixture
+def fake_turn(monkeypatch):
+    """Replace the LLM turn with one that echoes the context it was given"""
+    calls = []
+
+    def run_chat_turn(messages, config, tools, raise_errors=False, host=None, rate_limiter=None):
+        calls.append(messages)
+        if "fail" in messages[-1]["content"]:
+            raise RuntimeError("boom")
+        return {"role": "assistant", "content": messages[0]["content"]}
+
+    monkeypatch.setattr(mcpBatch, "run_chat_turn", run_chat_turn)
+    monkeypatch.setattr(mcpBatch, "init_openai", lambda config: None)
+    return calls
+
+
+def test_attachments_keyed_by_path_and_resolved_from_input_dir(tmp_path, monkeypatch, fake_turn):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a" / "report.txt").write_text("first report")
+    (tmp_path / "b" / "report.txt").write_text("second report")
+    records = tmp_path / "in.jsonl"
+    records.write_text(json.dumps({
+        "id": "r1", "prompt": "compare", "attachments": ["a/report.txt", "b/report.txt"]
+    }) + "\n")
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    summary = run_batch(str(records), str(tmp_path / "out.jsonl"), dict(mcpBatch.DEFAULT_CONFIG),
+                        workers=1, tools_dir=str(tmp_path / "no_tools"))
+
+    assert summary["failed"] == 0
+    context = fake_turn[0][0]["content"]
+    assert "=== a/report.txt ===\nfirst report" in context
+    assert "=== b/report.txt ===\nsecond report" in context
+
+
+def test_run_batch_resumes_from_checkpoint(tmp_path, fake_turn):
+    records = tmp_path / "in.jsonl"
+    records.write_text("\n".join(json.dumps(r) for r in [
+        {"id": "ok1", "prompt": "hello"},
+        {"id": "bad", "prompt": "fail please"},
+        {"prompt": "no id"},
+    ]) + "\n")
+    output = tmp_path / "out.jsonl"
+    config = dict(mcpBatch.DEFAULT_CONFIG)
+
+    first = run_batch(str(records), str(output), config, workers=2, tools_dir=str(tmp_path / "t"))
+    assert (first["processed"], first["failed"], first["skipped"]) == (3, 1, 0)
+
+    # Only the failed record is retried
+    second = run_batch(str(records), str(output), config, workers=2, tools_dir=str(tmp_path / "t"))
+    assert (second["processed"], second["failed"], second["skipped"]) == (1, 1, 2)
+
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(r["id"] for r in results if r["success"]) == ["line-3", "ok1"]
@@ -0,0 +1,118 @@
+import io
+import os
+import sys
+
+import pytest
+
+for module in ("streamlit", "openai", "pandas", "PyPDF2", "docx", "pptx"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docx
+import pptx
+from pptx.util import Inches
+
+from mcpGPT import ExtractionBudget, extract_document, extract_document_cached, process_uploaded_files
+from stateBackend import MemoryStateBackend
+
+
+def named_file(data: bytes, name: str) -> io.BytesIO:
+    file = io.BytesIO(data)
+    file.name = name
+    return file
+
+
+def make_docx() -> io.BytesIO:
+    document = docx.Document()
+    document.add_heading("Report", level=1)
+    document.add_paragraph("Intro paragraph.")
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text, table.cell(0, 1).text = "name", "value"
+    table.cell(1, 0).text, table.cell(1, 1).text = "a, b", "1"
+    document.add_paragraph("After the table.")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return named_file(buffer.getvalue(), "report.docx")
+
+
+def make_pptx() -> io.BytesIO:
+    prs = pptx.Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[5])  # title only
+    slide.shapes.title.text = "Results"
+    group = slide.shapes.add_group_shape()
+    group.shapes.add_textbox(Inches(1), Inches(2), Inches(3), Inches(1)).text_frame.text = "Inside group"
+    rows = slide.shapes.add_table(2, 2, Inches(1), Inches(4), Inches(4), Inches(1)).table
+    rows.cell(0, 0).text, rows.cell(0, 1).text = "q", "revenue"
+    rows.cell(1, 0).text, rows.cell(1, 1).text = "Q1", "10"
+    slide.notes_slide.notes_text_frame.text = "Speaker remark"
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return named_file(buffer.getvalue(), "deck.pptx")
+
+
+def test_budget_truncates_chars_and_counts_omissions():
+    budget = ExtractionBudget(max_chars=10, max_elements=100)
+    budget.add("12345")
+    budget.add("6789012345")
+    budget.add("dropped")
+    budget.add("   ")  # blank elements are ignored
+
+    assert budget.parts == ["12345", "67890"]
+    assert budget.report() == {
+        "truncated": True, "chars_kept": 10, "chars_omitted": 12,
+        "elements_kept": 2, "elements_omitted": 1
+    }
+    assert budget.text().endswith("[Truncated: 1 elements and 12 characters omitted]")
+
+
+def test_budget_caps_elements():
+    budget = ExtractionBudget(max_chars=1000, max_elements=2)
+    for text in ("a", "b", "c"):
+        budget.add(text)
+    assert budget.text().startswith("a\nb\n[Truncated: 1 elements")
+
+
+def test_budget_untruncated_text_has_no_footer():
+    budget = ExtractionBudget(max_chars=1000, max_elements=10)
+    budget.add("only")
+    assert budget.text() == "only"
+    assert budget.report()["truncated"] is False
+
+
+def test_docx_keeps_reading_order_and_tables_as_csv():
+    text, report = extract_document(make_docx())
+    assert text == (
+        "## Report\nIntro paragraph.\n[Table 1]\nname,value\n\"a, b\",1\nAfter the table."
+    )
+    assert report["truncated"] is False
+
+
+def test_pptx_extracts_title_groups_tables_and_notes():
+    text, _ = extract_document(make_pptx())
+    assert text.splitlines() == [
+        "## Slide 1: Results", "Inside group", "[Table]", "q,revenue", "Q1,10", "Notes: Speaker remark"
+    ]
+
+
+def test_extract_document_applies_caps():
+    text, report = extract_document(named_file(b"x" * 50, "notes.txt"), max_chars=20)
+    assert text.startswith("x" * 20 + "\n[Truncated")
+    assert report["chars_omitted"] == 30
+
+
+def test_cached_extraction_is_keyed_by_content_and_caps():
+    cache = MemoryStateBackend()
+    first = extract_document_cached(named_file(b"hello", "a.txt"), 100, 10, cache)
+    assert extract_document_cached(named_file(b"hello", "b.txt"), 100, 10, cache) == first
+    assert extract_document_cached(named_file(b"hello", "a.txt"), 3, 10, cache)[0].startswith("hel\n")
+
+
+def test_failed_file_does_not_drop_the_others():
+    results = process_uploaded_files([
+        named_file(b"not a zip", "broken.docx"),
+        named_file(b"fine", "ok.txt"),
+    ])
+    content, report = results["broken.docx"]
+    assert content is None and report["error"]
+    assert results["ok.txt"][0] == "fine"
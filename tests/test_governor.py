@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("streamlit", "openai", "pandas", "PyPDF2", "docx", "pptx"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import mcpGPT
+from mcpGPT import (
+    MAX_TOOL_ROUNDS,
+    build_messages,
+    govern_tool_result,
+    preview_tool_result,
+    read_artifact,
+    run_chat_turn,
+    save_artifact,
+)
+from stateBackend import MemoryStateBackend
+
+CONFIG = {**mcpGPT.DEFAULT_CONFIG, "tool_output_max_tokens": 200, "tool_output_total_tokens": 1000}
+BIG_TEXT = "".join(f"line {i}\n" for i in range(2000))
+
+
+def tool(function, spill_output=True):
+    return {"function": function, "schema": {}, "description": "", "max_output_tokens": None,
+            "spill_output": spill_output, "code": ""}
+
+
+def tool_call(name, call_id="call-1", **arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def reply(content=None, tool_calls=None):
+    return SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls)
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Scripted chat_with_llm: each item is a response, or a function of the messages"""
+    script = []
+    requests = []
+
+    def chat_with_llm(messages, config=None, tools=None, raise_errors=False):
+        requests.append({"messages": messages, "tools": tools})
+        step = script.pop(0)
+        return step(messages) if callable(step) else step
+
+    monkeypatch.setattr(mcpGPT, "chat_with_llm", chat_with_llm)
+    return SimpleNamespace(script=script, requests=requests)
+
+
+def test_small_result_is_sent_as_is():
+    assert govern_tool_result("t", "short", 100) == ("short", None)
+
+
+def test_large_text_is_previewed_and_returned_as_artifact():
+    content, artifact = govern_tool_result("t", BIG_TEXT, 100)
+    assert len(content) <= 400
+    assert artifact["content"] == BIG_TEXT and artifact["format"] == "text"
+    assert f'artifact_id="{artifact["id"]}"' in content
+    assert content.startswith("line 0")
+
+
+def test_large_dataframe_is_stored_as_csv():
+    df = pd.DataFrame({"n": range(5000), "label": ["x"] * 5000})
+    content, artifact = govern_tool_result("t", df, 300)
+    assert content.startswith("DataFrame with 5000 rows x 2 columns")
+    assert artifact["format"] == "csv"
+    assert artifact["content"].splitlines()[0] == "n,label"
+
+
+def test_exhausted_budget_sends_only_the_notice():
+    content, artifact = govern_tool_result("t", BIG_TEXT, 0)
+    assert content.startswith("[Result truncated") and artifact is not None
+
+
+@pytest.mark.parametrize("max_chars", [7, 8, 50, 51, 1000])
+def test_text_preview_stays_within_max_chars_and_keeps_the_tail(max_chars):
+    preview = preview_tool_result(BIG_TEXT, BIG_TEXT, max_chars)
+    assert len(preview) <= max_chars
+    half = (max_chars - 7) // 2
+    assert preview == BIG_TEXT[:half] + "\n[...]\n" + (BIG_TEXT[-half:] if half else "")
+
+
+def test_artifacts_are_scoped_to_their_session():
+    backend = MemoryStateBackend()
+    save_artifact(backend, "alice", "t", {"id": "abc", "format": "text", "content": BIG_TEXT})
+    page = read_artifact(backend, "alice", "abc", offset=7, length=14)
+    assert page.splitlines()[1:] == ["line 1", "line 2", "", "[Next page: offset=21]"]
+    assert read_artifact(backend, "bob", "abc") == "Artifact abc not found"
+
+
+def test_read_artifact_page_fits_max_chars():
+    backend = MemoryStateBackend()
+    save_artifact(backend, "s", "t", {"id": "abc", "format": "text", "content": BIG_TEXT})
+    assert len(read_artifact(backend, "s", "abc", max_chars=300)) <= 300
+    assert "used up" in read_artifact(backend, "s", "abc", offset=40, max_chars=20)
+
+
+def test_tool_rounds_spill_then_read_artifact(llm):
+    backend = MemoryStateBackend()
+    tools = {"dump": tool(lambda: BIG_TEXT)}
+
+    def read_spilled(messages):
+        artifact_id = messages[-1]["content"].split('artifact_id="')[1].split('"')[0]
+        return reply(tool_calls=[tool_call("read_artifact", "call-2", artifact_id=artifact_id)])
+
+    llm.script.extend([reply(tool_calls=[tool_call("dump")]), read_spilled, reply("done")])
+    msg = run_chat_turn([{"role": "user", "content": "go"}], CONFIG, tools, backend=backend, session_id="s")
+
+    assert msg["content"] == "done"
+    assert msg["tools_used"] == ["dump", "read_artifact"]
+    assert [a["tool"] for a in msg["artifacts"]] == ["dump"]
+    page = llm.requests[2]["messages"][-1]["content"]
+    assert page.startswith(f"[Artifact {msg['artifacts'][0]['id']} from dump (text)")
+    assert backend.get(f"session:s:artifact:{msg['artifacts'][0]['id']}")["content"] == BIG_TEXT
+
+
+def test_turn_budget_caps_every_tool_message(llm):
+    tools = {"dump": tool(lambda: BIG_TEXT), "pager": tool(lambda: BIG_TEXT, spill_output=False)}
+    calls = [tool_call("dump", f"d{i}") for i in range(3)] + [tool_call("pager", "p")]
+
+    def read_first_spill(messages):
+        artifact_id = messages[-4]["content"].split('artifact_id="')[1].split('"')[0]
+        return reply(tool_calls=[tool_call("read_artifact", "r", artifact_id=artifact_id)])
+
+    llm.script.extend([reply(tool_calls=calls), read_first_spill, reply("done")])
+    run_chat_turn([{"role": "user", "content": "go"}], CONFIG, tools)
+
+    tool_messages = {m["tool_call_id"]: m["content"] for m in llm.requests[-1]["messages"] if m["role"] == "tool"}
+    first_round = [tool_messages[call.id] for call in calls]
+    assert sum(len(content) for content in first_round) <= CONFIG["tool_output_total_tokens"] * 4
+    assert tool_messages["p"].endswith("budget of this turn is used up]")
+    assert tool_messages["r"].startswith("[Tool output budget for this turn is used up")
+
+
+def test_tool_rounds_are_bounded(llm):
+    tools = {"noop": tool(lambda: "ok")}
+    llm.script.extend([reply(tool_calls=[tool_call("noop")])] * MAX_TOOL_ROUNDS + [reply("forced answer")])
+    msg = run_chat_turn([{"role": "user", "content": "go"}], CONFIG, tools)
+
+    assert msg["content"] == "forced answer"
+    assert len(msg["tools_used"]) == MAX_TOOL_ROUNDS
+    assert llm.requests[-1]["tools"] == {}
+
+
+def test_missing_content_is_not_returned_as_none(llm):
+    llm.script.append(reply(None))
+    assert run_chat_turn([{"role": "user", "content": "go"}], CONFIG, {})["content"] == "[No content]"
+
+
+def test_artifact_ids_reach_later_turns():
+    conversation = [
+        {"role": "user", "content": "go"},
+        {"role": "assistant", "content": "done", "artifacts": [{"id": "abc", "tool": "dump"}]},
+    ]
+    assert build_messages({}, conversation)[1]["content"] == (
+        "done\n[Stored tool outputs, readable with read_artifact: abc (dump)]"
+    )
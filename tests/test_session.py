@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+for module in ("streamlit", "openai", "pandas", "PyPDF2", "docx", "pptx"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcpGPT import (
+    DEFAULT_CONFIG,
+    get_session_secret,
+    load_session_state,
+    resolve_api_key,
+    session_exists,
+    sign_session_id,
+    store_session_config,
+    store_session_value,
+    verify_session_token,
+)
+from stateBackend import MemoryStateBackend
+
+SESSION = "0123456789abcdef0123456789abcdef"
+
+
+def test_signed_session_id_roundtrips():
+    token = sign_session_id(SESSION, b"secret")
+    assert verify_session_token(token, b"secret") == SESSION
+
+
+@pytest.mark.parametrize("token", [
+    None, "", SESSION, f"{SESSION}.", "attacker-chosen-id",
+    sign_session_id(SESSION, b"other secret"),
+    sign_session_id("0123456789ABCDEF0123456789ABCDEF", b"secret"),
+])
+def test_unsigned_or_forged_tokens_are_rejected(token):
+    assert verify_session_token(token, b"secret") is None
+
+
+def test_session_secret_prefers_env_then_is_generated_once(monkeypatch):
+    backend = MemoryStateBackend()
+    monkeypatch.setenv("MCP_SESSION_SECRET", "from-env")
+    assert get_session_secret(backend) == b"from-env"
+
+    monkeypatch.delenv("MCP_SESSION_SECRET")
+    generated = get_session_secret(backend)
+    assert len(generated) == 64
+    assert get_session_secret(backend) == generated
+
+
+def test_session_exists_only_with_stored_data():
+    backend = MemoryStateBackend()
+    assert not session_exists(backend, SESSION)
+    store_session_value(backend, SESSION, 'conversation', [])
+    assert session_exists(backend, SESSION)
+
+
+def test_config_is_per_session_and_never_stores_the_key():
+    backend = MemoryStateBackend()
+    store_session_config(backend, "alice", {**DEFAULT_CONFIG, "api_base": "https://evil", "api_key": "sk-a"})
+
+    assert load_session_state(backend, "alice")['config']['api_base'] == "https://evil"
+    assert load_session_state(backend, "bob")['config'] == DEFAULT_CONFIG
+    assert "api_key" not in backend.get("session:alice:config")
+    assert backend.get("config") is None
+
+
+def test_server_key_only_goes_to_the_default_endpoint(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-server")
+    assert resolve_api_key(DEFAULT_CONFIG) == "sk-server"
+    assert resolve_api_key(DEFAULT_CONFIG, "sk-own") == "sk-own"
+    custom = {**DEFAULT_CONFIG, "api_base": "https://elsewhere"}
+    assert resolve_api_key(custom) == DEFAULT_CONFIG['api_key']
+    assert resolve_api_key(custom, "sk-own") == "sk-own"
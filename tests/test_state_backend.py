@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stateBackend
+from stateBackend import (
+    MemoryStateBackend,
+    RedisStateBackend,
+    SQLiteStateBackend,
+    StateBackend,
+    get_state_backend,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    if request.param == "sqlite":
+        return SQLiteStateBackend(str(tmp_path / "state.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStateBackend(client=fakeredis.FakeRedis())
+
+
+def test_get_missing_returns_default(backend):
+    assert backend.get("missing") is None
+    assert backend.get("missing", []) == []
+
+
+def test_set_then_get_roundtrips_json(backend):
+    value = {"conversation": [{"role": "user", "content": "héllo"}], "count": 3}
+    backend.set("session:a:conversation", value)
+    assert backend.get("session:a:conversation") == value
+
+
+def test_set_overwrites(backend):
+    backend.set("key", 1)
+    backend.set("key", 2)
+    assert backend.get("key") == 2
+
+
+def test_delete(backend):
+    backend.set("key", "value")
+    backend.delete("key")
+    assert backend.get("key", "gone") == "gone"
+    backend.delete("key")  # deleting a missing key is not an error
+
+
+def test_value_without_ttl_does_not_expire(backend):
+    backend.set("config", {"model": "m"})
+    assert backend.get("config") == {"model": "m"}
+
+
+@pytest.mark.parametrize("backend_class", [MemoryStateBackend, SQLiteStateBackend])
+def test_ttl_expiry(backend_class, tmp_path, monkeypatch):
+    backend = backend_class() if backend_class is MemoryStateBackend else backend_class(str(tmp_path / "s.db"))
+    now = time.time()
+    monkeypatch.setattr(stateBackend.time, "time", lambda: now)
+    backend.set("session:a:conversation", ["msg"], ttl=60)
+    assert backend.get("session:a:conversation") == ["msg"]
+
+    monkeypatch.setattr(stateBackend.time, "time", lambda: now + 61)
+    assert backend.get("session:a:conversation") is None
+
+
+def test_sqlite_sweep_deletes_expired_rows(tmp_path, monkeypatch):
+    backend = SQLiteStateBackend(str(tmp_path / "s.db"))
+    now = time.time()
+    monkeypatch.setattr(stateBackend.time, "time", lambda: now)
+    backend.set("old", 1, ttl=10)
+
+    monkeypatch.setattr(stateBackend.time, "time", lambda: now + SQLiteStateBackend.SWEEP_INTERVAL + 11)
+    backend.set("new", 2)
+    rows = backend._conn().execute("SELECT key FROM state").fetchall()
+    assert rows == [("new",)]
+
+
+def test_redis_ttl_uses_expiry():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    backend = RedisStateBackend(client=client)
+    backend.set("session:a:conversation", [], ttl=3600)
+    backend.set("config", {})
+    assert 0 < client.ttl("mcpgpt:session:a:conversation") <= 3600
+    assert client.ttl("mcpgpt:config") == -1
+
+
+def test_memory_evicts_least_recently_used():
+    backend = MemoryStateBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+    assert backend.get("c") == 3
+
+
+def test_state_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StateBackend()
+
+
+def test_get_state_backend_urls(tmp_path):
+    assert isinstance(get_state_backend("memory://"), MemoryStateBackend)
+    assert isinstance(get_state_backend(f"sqlite:///{tmp_path}/s.db"), SQLiteStateBackend)
+    with pytest.raises(ValueError):
+        get_state_backend("ftp://nope")
+
+
+def _write_keys(path: str, prefix: str, count: int):
+    backend = SQLiteStateBackend(path)
+    for i in range(count):
+        backend.set(f"{prefix}:{i}", {"writer": prefix, "i": i})
+
+
+def test_sqlite_shared_across_processes(tmp_path):
+    path = str(tmp_path / "shared.db")
+    SQLiteStateBackend(path).set("from_parent", "hello")
+
+    context = multiprocessing.get_context("spawn")
+    writers = [context.Process(target=_write_keys, args=(path, name, 50)) for name in ("a", "b")]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(60)
+        assert writer.exitcode == 0
+
+    reader = SQLiteStateBackend(path)
+    assert reader.get("from_parent") == "hello"
+    for name in ("a", "b"):
+        for i in range(50):
+            assert reader.get(f"{name}:{i}") == {"writer": name, "i": i}
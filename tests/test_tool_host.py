@@ -0,0 +1,58 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+for module in ("streamlit", "openai", "pandas", "PyPDF2", "docx", "pptx"):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from toolHost import ToolHost
+
+TOOL = '''
+import openai
+import time
+
+function_schema = {"type": "object", "properties": {"sleep": {"type": "number"}}}
+
+def function_call(sleep: float = 0):
+    time.sleep(sleep)
+    return f"{openai.api_base} {openai.api_key}"
+'''
+
+
+@pytest.fixture
+def host(tmp_path):
+    (tmp_path / "tool-whoami.py").write_text(TOOL)
+    host = ToolHost(workers=1, tools_dir=str(tmp_path))
+    yield host
+    host.shutdown()
+
+
+def test_each_call_uses_the_callers_openai_settings(host):
+    alice = {"api_type": "azure", "api_base": "https://a", "api_key": "key-a", "api_version": "v"}
+    bob = {**alice, "api_base": "https://b", "api_key": "key-b"}
+
+    assert host.call("whoami", {}, openai_config=alice)["content"] == "https://a key-a"
+    assert host.call("whoami", {}, openai_config=bob)["content"] == "https://b key-b"
+    assert host.generation == 0  # no restart between callers
+
+
+def test_waiting_caller_is_released_on_shutdown(host):
+    busy = threading.Thread(target=host.call, args=("whoami", {"sleep": 3}))
+    busy.start()
+    while host.idle.qsize():
+        time.sleep(0.01)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(host.call("whoami", {})))
+    waiter.start()
+
+    host.shutdown()
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert results[0]["success"] is False
+    assert "shut down" in results[0]["error"]
+    busy.join(10)
@@ -0,0 +1,277 @@
+"""Out-of-process tool host for mcpGPT.
+
+A pool of preforked worker processes imports the tools/tool-*.py modules once and
+stays warm. `execute_tool` dispatches calls to an idle worker over a
+multiprocessing pipe (arguments and results are pickled), so a crashing or
+leaking tool only takes down its worker, never the Streamlit server.
+
+Workers are started with the forkserver method (spawn where unavailable) so the
+multithreaded Streamlit server is never forked. They hold no credentials of their
+own: each call carries the caller's OpenAI settings, applied with `init_openai`
+before the tool runs, so one pool serves every session without restarts.
+
+Workers are recycled after `max_calls` calls, when their resident memory goes
+over `max_memory_mb`, or when a call exceeds `timeout` seconds. Per-tool latency
+and failure counts are available through `ToolHost.stats()`.
+
+Tools running in a worker cannot draw Streamlit widgets; they return
+{"result": ..., "ui_directives": [...]} instead and the UI process renders the
+directives (see `render_ui_directives` in mcpGPT.py).
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+from typing import Dict
+
+from mcpGPT import discover_tools, execute_tool, init_openai
+
+DESCRIBE_REQUEST = "__describe__"
+ACQUIRE_POLL_SECONDS = 0.5  # how often a caller waiting for a worker checks for shutdown
+
+
+class HostClosed(Exception):
+    """Raised to callers waiting for a worker when the host shuts down"""
+
+
+def _memory_mb() -> float:
+    """Resident memory of the current process in MB (0 if unknown)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+def _default_start_method() -> str:
+    """forkserver where available: forking a multithreaded server is unsafe"""
+    methods = multiprocessing.get_all_start_methods()
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+def _worker_main(conn, tools_dir: str):
+    """Worker loop: import tools once, then serve calls until told to stop"""
+    tools = discover_tools(tools_dir)
+    openai_config = None
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+
+        tool_name, arguments, max_tokens, call_openai_config = request
+        if call_openai_config and call_openai_config != openai_config:
+            openai_config = call_openai_config
+            init_openai(openai_config)
+        if tool_name == DESCRIBE_REQUEST:
+            result = {
+                name: {key: value for key, value in info.items() if key != 'function'}
+                for name, info in tools.items()
+            }
+        else:
+            result = execute_tool(tool_name, arguments, tools, max_tokens=max_tokens)
+            # Raw results only travel back when they can be pickled
+            try:
+                pickle.dumps(result.get('raw_result'))
+            except Exception:
+                result.pop('raw_result', None)
+
+        conn.send((result, _memory_mb()))
+    conn.close()
+
+
+class _Worker:
+    """Parent-side handle on one worker process"""
+
+    def __init__(self, context, tools_dir: str, generation: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, tools_dir), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.generation = generation
+        self.calls = 0
+
+    def stop(self, timeout: float = 5):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ToolHost:
+    """Pool of warm worker processes executing tools"""
+
+    def __init__(self, workers: int = 2, tools_dir: str = 'tools', max_calls: int = 200,
+                 max_memory_mb: float = 1024, timeout: float = 300, start_method: str = None):
+        self.size = max(1, workers)
+        self.tools_dir = tools_dir
+        self.max_calls = max_calls
+        self.max_memory_mb = max_memory_mb
+        self.timeout = timeout
+        self.context = multiprocessing.get_context(start_method or _default_start_method())
+        self.generation = 0
+        self.version = None
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.tool_stats = {}
+        self.recycled = 0
+        self.closed = False
+
+        for _ in range(self.size):
+            self.idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.context, self.tools_dir, self.generation)
+
+    def _acquire(self) -> _Worker:
+        # Wait in short slices so callers are released when the host shuts down
+        while True:
+            if self.closed:
+                raise HostClosed("tool host is shut down")
+            try:
+                worker = self.idle.get(timeout=ACQUIRE_POLL_SECONDS)
+                break
+            except queue.Empty:
+                continue
+        if self.closed:
+            worker.stop()
+            raise HostClosed("tool host is shut down")
+        if worker.generation != self.generation or not worker.process.is_alive():
+            worker.stop()
+            worker = self._spawn()
+        return worker
+
+    def _release(self, worker: _Worker, memory_mb: float = 0.0):
+        if self.closed:
+            worker.stop()
+            return
+        if worker.calls >= self.max_calls or memory_mb > self.max_memory_mb:
+            worker.stop()
+            worker = self._spawn()
+            with self.lock:
+                self.recycled += 1
+        self.idle.put(worker)
+
+    def _replace(self, worker: _Worker):
+        """Discard a crashed or hung worker and put a fresh one in the pool"""
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join()
+        worker.conn.close()
+        with self.lock:
+            self.recycled += 1
+        if not self.closed:
+            self.idle.put(self._spawn())
+
+    def _request(self, tool_name: str, arguments: Dict, max_tokens: int = None,
+                 openai_config: Dict = None):
+        """Send one request to an idle worker and return (result, error message)"""
+        try:
+            worker = self._acquire()
+        except HostClosed as e:
+            return None, str(e)
+        try:
+            worker.conn.send((tool_name, arguments, max_tokens, openai_config))
+            if not worker.conn.poll(self.timeout):
+                self._replace(worker)
+                return None, f"timed out after {self.timeout}s"
+            result, memory_mb = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            self._replace(worker)
+            return None, f"worker process died ({str(e) or type(e).__name__})"
+        except Exception:
+            # Arguments or result could not be pickled; the worker is still usable
+            self._release(worker)
+            raise
+        worker.calls += 1
+        self._release(worker, memory_mb)
+        return result, None
+
+    def call(self, tool_name: str, arguments: Dict, max_tokens: int = None,
+             openai_config: Dict = None) -> Dict:
+        """Execute a tool in a worker and return the same response shape as execute_tool
+
+        max_tokens is applied by the output governor inside the worker; openai_config
+        (the caller's api_type/api_base/api_key/api_version) is set up before the tool runs.
+        """
+        start_time = time.time()
+        try:
+            result, error = self._request(tool_name, arguments, max_tokens, openai_config)
+            if error:
+                result = {
+                    "success": False,
+                    "content": f"Error executing tool {tool_name}: {error}",
+                    "error": error
+                }
+        except Exception as e:
+            result = {
+                "success": False,
+                "content": f"Error executing tool {tool_name}: {str(e)}",
+                "error": str(e)
+            }
+        self._record(tool_name, time.time() - start_time, result['success'])
+        return result
+
+    def describe(self) -> Dict:
+        """Return the tool registry (schema, description, code) as seen by the workers"""
+        result, error = self._request(DESCRIBE_REQUEST, {})
+        if error:
+            raise RuntimeError(f"Tool host could not list tools: {error}")
+        return result
+
+    def reload(self, version: str = None):
+        """Make every worker re-import the tools before its next call"""
+        with self.lock:
+            self.generation += 1
+            self.version = version
+
+    def _record(self, tool_name: str, latency: float, success: bool):
+        with self.lock:
+            entry = self.tool_stats.setdefault(
+                tool_name, {"calls": 0, "failures": 0, "total_latency": 0.0, "max_latency": 0.0}
+            )
+            entry["calls"] += 1
+            entry["failures"] += 0 if success else 1
+            entry["total_latency"] += latency
+            entry["max_latency"] = max(entry["max_latency"], latency)
+
+    def stats(self) -> Dict:
+        """Per-tool call counts, failure counts and latencies"""
+        with self.lock:
+            return {
+                name: {
+                    "calls": entry["calls"],
+                    "failures": entry["failures"],
+                    "avg_latency": round(entry["total_latency"] / entry["calls"], 3),
+                    "max_latency": round(entry["max_latency"], 3)
+                }
+                for name, entry in self.tool_stats.items()
+            }
+
+    def shutdown(self):
+        """Stop every idle worker; busy workers are stopped when their call returns
+
+        Callers still waiting for a worker get a "tool host is shut down" error.
+        """
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().stop()
+            except queue.Empty:
+                break
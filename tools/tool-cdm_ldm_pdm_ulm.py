@@ -23,15 +23,7 @@ function_schema = {
     "required": ["filename", "content"]
 }
 def function_call(filename: str, content: str, filetype: str = "mmd"):
-    """Creates a Streamlit interface to preview Mermaid code, render the diagram, and provide download buttons."""
-    import streamlit as st
-
-    st.title("📊 Mermaid Diagram Generator")
-
-    # Preview Mermaid source
-    with st.expander("📁 Mermaid Source Preview"):
-        st.code(content, language="mermaid")
-
+    """Returns UI directives to preview Mermaid code, render the diagram, and provide download buttons."""
     # Mermaid rendering
     mermaid_html = f"""
     <div class="mermaid">
@@ -49,18 +41,30 @@ def function_call(filename: str, content: str, filetype: str = "mmd"):
     </script>
     """
 
-    st.components.v1.html(mermaid_html, height=400, scrolling=True)
-
-    # Download button
-    st.download_button(
-        label="⬇️ Download Mermaid File",
-        data=content,
-        file_name=f"{filename}.mmd",
-        mime="text/plain",
-        key=f"download_{filename}_mmd"
-    )
+    ui_directives = [
+        {"type": "markdown", "body": "## 📊 Mermaid Diagram Generator"},
+        # Preview Mermaid source
+        {
+            "type": "code",
+            "expander": "📁 Mermaid Source Preview",
+            "body": content,
+            "language": "mermaid"
+        },
+        {"type": "html", "body": mermaid_html, "height": 400, "scrolling": True},
+        # Download button
+        {
+            "type": "download_button",
+            "label": "⬇️ Download Mermaid File",
+            "data": content,
+            "file_name": f"{filename}.mmd",
+            "mime": "text/plain"
+        }
+    ]
 
-    return (
-        "✅ Mermaid diagram ready! You can preview the source, render it live, "
-        "and download the Mermaid file for reuse or modification."
-    )
+    return {
+        "result": (
+            "✅ Mermaid diagram ready! You can preview the source, render it live, "
+            "and download the Mermaid file for reuse or modification."
+        ),
+        "ui_directives": ui_directives
+    }
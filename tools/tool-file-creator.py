@@ -25,22 +25,28 @@ function_schema = {
 # Tool description
 description = "Générateur de fichiers avec bouton de téléchargement natif Streamlit"
 
-# Main function (à intégrer dans un script Streamlit)
+# Main function (widgets are rendered by mcpGPT from the returned UI directives)
 def function_call(filename: str, content: str, filetype: str = "py"):
-    """Crée un bouton de téléchargement Streamlit avec prévisualisation"""
-    import streamlit as st
-
-    # Interface utilisateur
-    with st.expander("📁 Prévisualisation du fichier"):
-        st.code(content, language=filetype)
-
-    # Génération du bouton de téléchargement
-    st.download_button(
-        label="⬇️ Télécharger le fichier",
-        data=content,
-        file_name=f"{filename}.{filetype}",
-        mime="application/json" if filetype == "json" else f"text/{filetype}",
-        key=f"download_{filename}"
-    )
+    """Demande un bouton de téléchargement Streamlit avec prévisualisation"""
+    ui_directives = [
+        # Interface utilisateur
+        {
+            "type": "code",
+            "expander": "📁 Prévisualisation du fichier",
+            "body": content,
+            "language": filetype
+        },
+        # Génération du bouton de téléchargement
+        {
+            "type": "download_button",
+            "label": "⬇️ Télécharger le fichier",
+            "data": content,
+            "file_name": f"{filename}.{filetype}",
+            "mime": "application/json" if filetype == "json" else f"text/{filetype}"
+        }
+    ]
 
-    return f"l'utilisateur a maintenant acces a un bouton pour télécharé sont fichier tu peux lui dire vous pouver cliquer sur le bouton download pour le téléchargé ci dessusne lui donne pas de lien !!!"
+    return {
+        "result": f"l'utilisateur a maintenant acces a un bouton pour télécharé sont fichier tu peux lui dire vous pouver cliquer sur le bouton download pour le téléchargé ci dessusne lui donne pas de lien !!!",
+        "ui_directives": ui_directives
+    }